@@ -1,15 +1,37 @@
+import io
 import os
 import re
+import sys
 import asyncio
+import contextlib
+import errno
+import hashlib
 import json
 import time
+import itertools
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import IntEnum
 from datetime import datetime
 from dotenv import load_dotenv
-from telethon import TelegramClient
+from telethon import TelegramClient, events
 from telethon.sessions import StringSession
-from telethon.errors import FloodWaitError
-from telethon.tl.types import MessageService, MessageMediaWebPage, MessageMediaUnsupported
+from telethon.errors import FloodWaitError, ChatForwardsRestrictedError, FileReferenceExpiredError, MediaEmptyError
+from telethon.tl.types import (
+    MessageMediaPhoto,
+    MessageMediaDocument,
+    Photo,
+    Document,
+    InputPhoto,
+    InputDocument,
+    DocumentAttributeFilename,
+    PeerChannel
+)
 from telegram import Update
+from telegram.error import RetryAfter, BadRequest, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -18,6 +40,7 @@ from telegram.ext import (
     filters
 )
 from aiohttp import web
+import aiosqlite
 
 # ==================== ENVIRONMENT VARIABLES ====================
 load_dotenv()
@@ -28,18 +51,58 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 OWNER_ID = int(os.getenv("OWNER_ID"))
 TARGET_CHANNEL = int(os.getenv("TARGET_CHANNEL"))
 PORT = int(os.getenv("PORT", 8000))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # WARNING hides per-media progress lines
 UPLOAD_DELAY = int(os.getenv("UPLOAD_DELAY", 3))
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
-DATABASE_FILE = "monitoring_channels.json"
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", 3))
+UPLOAD_CLIENTS = int(os.getenv("UPLOAD_CLIENTS", 1))
+DOWNLOAD_RATE = float(os.getenv("DOWNLOAD_RATE", 2))  # Media downloads started per second
+RATE_FLOOR = 0.1  # FloodWait never slows a bucket below 10% of its rate
+RATE_RECOVERY_STEP = 0.02  # Rate regained per token after a FloodWait (fraction of base)
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 3))
+MEMORY_BUFFER_LIMIT = int(os.getenv("MEMORY_BUFFER_LIMIT", 20 * 1024 * 1024))
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4))
+MONITOR_WORKERS = int(os.getenv("MONITOR_WORKERS", 4))  # Channels synced concurrently
+DOWNLOAD_PART_SIZE = 512 * 1024  # upload.getFile request size (4 KiB multiple, divides 1 MiB)
+STREAM_QUEUE_CHUNKS = 4  # Chunks buffered between download and upload when streaming
+FETCH_BATCH_SIZE = 100  # Max ids per messages.getMessages call
+STATUS_EDIT_INTERVAL = 3.0  # Min seconds between status message edits
+DB_FLUSH_INTERVAL = 5  # Seconds between monitoring DB saves
+BOT_POOL_SIZE = 32  # Bot API HTTP connections (python-telegram-bot default: 256)
+UNJOINED_POLL_INTERVAL = 30  # Seconds between polls of channels that get no pushed updates
+SUPERVISOR_MAX_BACKOFF = 60  # Max seconds before restarting a crashed worker
+DATABASE_FILE = "monitoring.db"
+LEGACY_DATABASE_FILE = "monitoring_channels.json"
 TEMP_DIR = "temp_media"
+ORPHAN_MAX_AGE = 3600  # Seconds before a leftover temp file is purged at startup
+
+# ==================== LOGGING ====================
+# Records are queued on the event loop; a listener thread does the stdout writes
+_log_queue = SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))  # stdout, like print()
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s", handlers=[QueueHandler(_log_queue)])
+log = logging.getLogger("bot")
+log.setLevel(LOG_LEVEL)
+_log_listener.start()
 
 # ==================== REGEX PATTERNS ====================
-MESSAGE_REGEX = r"https://t\.me/(?:c/)?([\w\d_]+)/(\d+)"
+MESSAGE_RE = re.compile(r"https://t\.me/(?:c/)?([\w\d_]+)/(\d+)")
 
 # ==================== CREATE TEMP DIRECTORY ====================
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
-    print(f"✅ Created temp directory: {TEMP_DIR}")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+def purge_orphan_temp_files():
+    """Delete temp media left behind by a crash (older than ORPHAN_MAX_AGE)"""
+    cutoff = time.time() - ORPHAN_MAX_AGE
+    removed = 0
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith("media_") and entry.is_file() and entry.stat().st_mtime < cutoff:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(entry.path)
+                    removed += 1
+    if removed:
+        log.info(f"🗑️  Removed {removed} orphaned temp files")
 
 # ==================== USERBOT ====================
 userbot = TelegramClient(
@@ -48,35 +111,309 @@ userbot = TelegramClient(
     API_HASH
 )
 
+# Extra connections on the same session, used for uploads and download slices
+upload_clients = [userbot]
+_upload_counter = itertools.count()
+target_peer = None  # TARGET_CHANNEL resolved once, valid for every client
+
+def next_upload_client():
+    """Round-robin client for send_file"""
+    return upload_clients[next(_upload_counter) % len(upload_clients)]
+
 # ==================== GLOBAL STATE ====================
-monitoring_channels = {}
-user_sessions = {}
+monitoring_channels = {}  # Source of truth, persisted lazily to SQLite
+_dirty_channels = set()  # chat ids changed since the last save
+
+class Step(IntEnum):
+    """Range setup conversation steps"""
+    SOURCE = 0
+    START = 1
+    END = 2
+
+@dataclass(slots=True)
+class UserSession:
+    """Range setup state for one user"""
+    step: Step = Step.SOURCE
+    source_chat_id: int = None
+    source_chat_name: str = None
+    start_msg_id: int = None
+
+user_sessions = {}  # user_id -> UserSession
+_entity_cache = OrderedDict()  # chat token (lower-case) -> (chat_id, title, cached_at)
+ENTITY_CACHE_SIZE = 128
+ENTITY_CACHE_TTL = 3600  # Seconds before a cached title is re-resolved
+_seen_media = OrderedDict()  # Recent (chat_id, msg_id) uploads, hot tier of seen_media
+SEEN_CACHE_SIZE = 50_000
+_tmp_counter = itertools.count()  # Unique temp file suffix within this process
+
+# ==================== RATE LIMITING ====================
+class TokenBucket:
+    """Adaptive async token bucket shared by every task that talks to Telegram"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate  # Configured tokens per second
+        self.rate = rate  # Current rate, lowered on FloodWait
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.until = 0.0  # Nothing handed out before this (FloodWait)
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds: float):
+        """FloodWait: block all callers for `seconds`, drop burst, slow down 25%"""
+        self.until = max(self.until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.until
+        self.rate = max(self.base_rate * RATE_FLOOR, self.rate * 0.75)
+    
+    async def acquire(self):
+        """Wait for a token"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.until:
+                    await asyncio.sleep(self.until - now)
+                    continue
+                
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    # Linear recovery towards the configured rate
+                    self.rate = min(self.base_rate, self.rate + self.base_rate * RATE_RECOVERY_STEP)
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Userbot posts into TARGET_CHANNEL; media downloads; Bot API status edits.
+# Skipped messages take no token.
+tg_bucket = TokenBucket(rate=1 / max(UPLOAD_DELAY, 0.1), burst=UPLOAD_BURST)
+dl_bucket = TokenBucket(rate=DOWNLOAD_RATE, burst=PREFETCH_DEPTH)
+bot_bucket = TokenBucket(rate=1.0, burst=3)
+
+class ThrottledEditor:
+    """
+    Debounced status message
+    - set_text() only stores the latest text
+    - A background task edits at most once per min_interval, skipping unchanged text
+    """
+    
+    def __init__(self, msg, min_interval: float = STATUS_EDIT_INTERVAL):
+        self.msg = msg
+        self.min_interval = min_interval
+        self.text = None  # Latest requested text
+        self.sent = None  # Text currently shown
+        self._task = None
+    
+    def set_text(self, text: str):
+        """Store text for the next flush"""
+        self.text = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        while True:
+            if self.text != self.sent:
+                await self._edit(self.text)
+            await asyncio.sleep(self.min_interval)
+    
+    async def _edit(self, text: str) -> bool:
+        """Edit once, False if Telegram asked us to retry later"""
+        await bot_bucket.acquire()
+        try:
+            await self.msg.edit_text(text)
+            self.sent = text
+        except RetryAfter as e:
+            bot_bucket.pause(e.retry_after)
+            return False
+        except BadRequest as e:
+            if "not modified" in e.message:
+                self.sent = text  # Already showing it, don't retry
+        except TelegramError:
+            pass
+        return True
+    
+    async def flush(self, text: str = None):
+        """Edit right away (rate-limit notices, final summary)"""
+        if text is not None:
+            self.text = text
+        if self.text != self.sent and not await self._edit(self.text):
+            # No background task may be left to retry (close) - once more after the pause
+            await self._edit(self.text)
+    
+    def cancel(self):
+        """Stop the background task"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def close(self, text: str = None):
+        """Stop the background task and show the final text"""
+        self.cancel()
+        await self.flush(text)
 
 # ==================== DATABASE FUNCTIONS ====================
-def load_monitoring_db():
-    """Load monitored channels from JSON"""
-    if os.path.exists(DATABASE_FILE):
+db_conn = None  # aiosqlite connection, opened by init_monitoring_db()
+
+async def init_monitoring_db():
+    """Open SQLite DB, create schema and import the legacy JSON file once"""
+    global db_conn
+    db_conn = await aiosqlite.connect(DATABASE_FILE)
+    # Append-only WAL: a save is a sequential log write, fsync only at checkpoints
+    await db_conn.execute("PRAGMA journal_mode=WAL")
+    await db_conn.execute("PRAGMA synchronous=NORMAL")
+    await db_conn.execute(
+        "CREATE TABLE IF NOT EXISTS channels ("
+        "id INTEGER PRIMARY KEY, "
+        "name TEXT NOT NULL, "
+        "added_at TEXT NOT NULL, "
+        "last_msg_id INTEGER NOT NULL)"
+    )
+    # Monitor uploads done past the saved cursor, so a restart never re-uploads them
+    await db_conn.execute(
+        "CREATE TABLE IF NOT EXISTS seen_media ("
+        "chat_id INTEGER NOT NULL, "
+        "msg_id INTEGER NOT NULL, "
+        "PRIMARY KEY (chat_id, msg_id)) WITHOUT ROWID"
+    )
+    # Media already in TARGET_CHANNEL, re-sent by reference instead of re-uploaded
+    await db_conn.execute(
+        "CREATE TABLE IF NOT EXISTS sent_media ("
+        "key TEXT PRIMARY KEY, "
+        "is_photo INTEGER NOT NULL, "
+        "id INTEGER NOT NULL, "
+        "access_hash INTEGER NOT NULL, "
+        "file_reference BLOB NOT NULL)"
+    )
+    await db_conn.commit()
+    
+    if os.path.exists(LEGACY_DATABASE_FILE):
         try:
-            with open(DATABASE_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+            with open(LEGACY_DATABASE_FILE, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"⚠️ Could not import {LEGACY_DATABASE_FILE}: {e}")
+            return
+        
+        await db_conn.executemany(
+            "INSERT OR IGNORE INTO channels (id, name, added_at, last_msg_id) VALUES (?, ?, ?, ?)",
+            [(int(chat_id), data["name"], data["added_at"], data["last_msg_id"]) for chat_id, data in legacy.items()]
+        )
+        await db_conn.commit()
+        os.replace(LEGACY_DATABASE_FILE, LEGACY_DATABASE_FILE + ".migrated")
+        log.info(f"✅ Imported {len(legacy)} channels from {LEGACY_DATABASE_FILE}")
+
+async def close_monitoring_db():
+    """Close SQLite DB"""
+    if db_conn is not None:
+        await db_conn.close()
 
-def save_monitoring_db(data):
-    """Save monitored channels to JSON"""
-    with open(DATABASE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+async def load_monitoring_db():
+    """Load monitored channels from SQLite"""
+    async with db_conn.execute("SELECT id, name, added_at, last_msg_id FROM channels") as cursor:
+        return {
+            chat_id: {"name": name, "added_at": added_at, "last_msg_id": last_msg_id}
+            async for chat_id, name, added_at, last_msg_id in cursor
+        }
+
+async def save_monitoring_db():
+    """Write channels changed since the last save to SQLite"""
+    if not _dirty_channels:
+        return
+    
+    rows = [
+        (chat_id, data["name"], data["added_at"], data["last_msg_id"])
+        for chat_id, data in monitoring_channels.items()
+        if chat_id in _dirty_channels
+    ]
+    # Cleared up front so changes made during the awaits below stay dirty
+    _dirty_channels.clear()
+    
+    try:
+        await db_conn.executemany(
+            "INSERT OR REPLACE INTO channels (id, name, added_at, last_msg_id) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        # Anything at or below a saved cursor is covered by the cursor itself
+        await db_conn.executemany(
+            "DELETE FROM seen_media WHERE chat_id = ? AND msg_id <= ?",
+            [(chat_id, last_msg_id) for chat_id, _, _, last_msg_id in rows]
+        )
+        await db_conn.commit()
+    except BaseException:
+        # Not saved - retry these rows on the next flush
+        _dirty_channels.update(chat_id for chat_id, _, _, _ in rows)
+        raise
+
+async def is_seen(chat_id: int, msg_id: int) -> bool:
+    """Check if a monitored message was already uploaded (memory first, then SQLite)"""
+    key = (chat_id, msg_id)
+    if key in _seen_media:
+        return True
+    async with db_conn.execute(
+        "SELECT 1 FROM seen_media WHERE chat_id = ? AND msg_id = ?", key
+    ) as cursor:
+        found = await cursor.fetchone() is not None
+    if found:
+        _remember_seen(key)
+    return found
+
+async def mark_seen(chat_id: int, msg_id: int):
+    """Record an uploaded monitored message, committed right away"""
+    _remember_seen((chat_id, msg_id))
+    await db_conn.execute(
+        "INSERT OR IGNORE INTO seen_media (chat_id, msg_id) VALUES (?, ?)", (chat_id, msg_id)
+    )
+    await db_conn.commit()
+
+def _remember_seen(key: tuple):
+    _seen_media[key] = None
+    if len(_seen_media) > SEEN_CACHE_SIZE:
+        _seen_media.popitem(last=False)
+
+async def lookup_sent_media(key: str):
+    """InputPhoto/InputDocument of media already uploaded under this key, or None"""
+    async with db_conn.execute(
+        "SELECT is_photo, id, access_hash, file_reference FROM sent_media WHERE key = ?", (key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    is_photo, media_id, access_hash, file_reference = row
+    return (InputPhoto if is_photo else InputDocument)(media_id, access_hash, file_reference)
+
+async def remember_sent_media(key: str, media):
+    """Store the photo/document of a message we just sent to TARGET_CHANNEL"""
+    item = getattr(media, "photo", None) or getattr(media, "document", None)
+    if item is None:
+        return
+    await db_conn.execute(
+        "INSERT OR REPLACE INTO sent_media (key, is_photo, id, access_hash, file_reference) VALUES (?, ?, ?, ?, ?)",
+        (key, isinstance(item, Photo), item.id, item.access_hash, item.file_reference)
+    )
+    await db_conn.commit()
+
+async def forget_sent_media(key: str):
+    """Drop a reference Telegram no longer accepts"""
+    await db_conn.execute("DELETE FROM sent_media WHERE key = ?", (key,))
+    await db_conn.commit()
+
+async def _persister():
+    """Flush in-memory monitoring state to SQLite every DB_FLUSH_INTERVAL"""
+    while True:
+        await asyncio.sleep(DB_FLUSH_INTERVAL)
+        try:
+            await save_monitoring_db()
+        except Exception as e:
+            log.error(f"❌ DB save error: {e}")
 
 def add_monitoring_channel(chat_id, chat_name, last_msg_id):
-    """Add channel to monitoring database"""
-    db = load_monitoring_db()
-    db[str(chat_id)] = {
-        "name": chat_name,
-        "added_at": datetime.now().isoformat(),
-        "last_msg_id": last_msg_id
-    }
-    save_monitoring_db(db)
+    """Add channel to in-memory monitoring state (persisted by _persister)"""
+    entry = monitoring_channels.setdefault(chat_id, {})
+    entry["name"] = chat_name
+    entry["added_at"] = datetime.now().isoformat()
+    entry["last_msg_id"] = last_msg_id
+    _dirty_channels.add(chat_id)
+    return entry
 
 # ==================== HEALTH CHECK SERVER ====================
 async def health_check(request):
@@ -93,153 +430,445 @@ async def start_health_server():
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', PORT)
     await site.start()
-    print(f"✅ Health check server running on port {PORT}")
+    log.info(f"✅ Health check server running on port {PORT}")
 
 # ==================== EXTRACT MESSAGE IDS FROM LINKS ====================
-async def get_message_ids(link: str) -> tuple:
-    """Extract chat_id and message_id from link"""
-    msg_match = re.search(MESSAGE_REGEX, link)
-    if msg_match:
-        chat = msg_match.group(1)
-        msg_id = int(msg_match.group(2))
-        
-        if chat.isdigit():
-            chat_id = int("-100" + chat)
-        else:
-            chat_id = chat
-        
+def parse_link(link: str) -> tuple:
+    """Extract chat token and message_id from link (no network)"""
+    msg_match = MESSAGE_RE.search(link)
+    if not msg_match:
+        return None, None
+    return msg_match.group(1), int(msg_match.group(2))
+
+async def resolve_entity(chat: str) -> tuple:
+    """Resolve a chat token to (chat_id, title), cached"""
+    # Same channel is usually linked several times in a row; usernames are case-insensitive
+    key = chat.lower()
+    cached = _entity_cache.get(key)
+    if cached and time.monotonic() - cached[2] < ENTITY_CACHE_TTL:
+        _entity_cache.move_to_end(key)
+        return cached[0], cached[1]
+    
+    try:
+        entity = await userbot.get_entity(int("-100" + chat) if chat.isdigit() else chat)
+        cached = (entity.id, entity.title, time.monotonic())  # Users/bots have no title
+    except Exception as e:
+        return None, f"Error: {e}"
+    
+    _entity_cache[key] = cached
+    _entity_cache.move_to_end(key)
+    if len(_entity_cache) > ENTITY_CACHE_SIZE:
+        _entity_cache.popitem(last=False)
+    return cached[0], cached[1]
+
+async def is_same_chat(chat: str, chat_id: int) -> bool:
+    """Check a parsed chat token against a resolved chat_id (RPC only on a cache miss)"""
+    if chat.isdigit():
+        return int(chat) == chat_id
+    resolved_id, _ = await resolve_entity(chat)
+    return resolved_id == chat_id
+
+# ==================== DOWNLOAD-UPLOAD (NO FORWARD HEADER, NO CAPTION) ====================
+def has_uploadable_media(msg) -> bool:
+    """Single skip decision: message carries media we can download & upload"""
+    # One type() per message; service messages, web pages, polls etc. fall through
+    media = getattr(msg, "media", None)
+    media_type = type(media)
+    if media_type is MessageMediaPhoto:
+        return type(media.photo) is Photo
+    if media_type is MessageMediaDocument:
+        return type(media.document) is Document  # Videos are documents
+    return False
+
+def _doc_ext(doc) -> str:
+    """Extension from a document's DocumentAttributeFilename"""
+    for attr in doc.attributes:
+        if type(attr) is DocumentAttributeFilename:
+            return os.path.splitext(attr.file_name)[1] or ".bin"
+    return ".bin"
+
+def media_extension(msg) -> str:
+    """Determine temp file extension for message media"""
+    return ".jpg" if msg.photo else ".mp4" if msg.video else _doc_ext(msg.document) if msg.document else ".bin"
+
+def _open_preallocated(path: str, size: int) -> int:
+    """Open a temp file with all blocks reserved (run in a thread, may write the whole file)"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # Slices land out of order, reserving up front avoids fragmented extents.
+        # Without native support (ZFS < 2.2, NFSv3) glibc emulates this by writing every block
         try:
-            entity = await userbot.get_entity(chat_id)
-            return entity.id, entity.title, msg_id
-        except Exception as e:
-            return None, f"Error: {e}", None
+            os.posix_fallocate(fd, 0, size)
+        except AttributeError:
+            os.ftruncate(fd, size)  # No fallocate on this platform: sparse file
+        except OSError as e:
+            # ENOSPC/EFBIG/EIO must fail now, not after downloading gigabytes
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+                raise
+            os.ftruncate(fd, size)  # Unsupported here (e.g. musl): sparse file
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+async def parallel_download(msg, path: str, size: int) -> str:
+    """Download a document as DOWNLOAD_WORKERS concurrent byte-range slices"""
+    parts = -(-size // DOWNLOAD_PART_SIZE)
+    parts_per_worker = -(-parts // DOWNLOAD_WORKERS)
+    fd = await asyncio.to_thread(_open_preallocated, path, size)
+    written = 0
+    
+    async def fetch_slice(client, first_part: int):
+        nonlocal written
+        offset = first_part * DOWNLOAD_PART_SIZE
+        async for chunk in client.iter_download(
+            msg.media,
+            offset=offset,
+            limit=parts_per_worker,
+            request_size=DOWNLOAD_PART_SIZE,
+            file_size=size
+        ):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            written += len(chunk)
     
-    return None, "Invalid link format", None
+    # Spread slices over every connection, each has its own per-connection cap
+    tasks = [
+        asyncio.create_task(fetch_slice(upload_clients[i % len(upload_clients)], first_part))
+        for i, first_part in enumerate(range(0, parts, parts_per_worker))
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        os.close(fd)
+    
+    # A slice that ended early would leave a hole in the file
+    if written != size:
+        raise ValueError(f"downloaded {written} of {size} bytes")
+    return path
 
-# ==================== PURE DOWNLOAD-UPLOAD (NO FORWARDING, NO CAPTION) ====================
-async def download_and_upload_media(source_chat_id: int, msg_id: int, temp_dir: str) -> bool:
+class MediaStream:
+    """Read-only file-like fed by iter_download chunks, consumed by upload_file"""
+    
+    def __init__(self, name: str):
+        self.name = name  # upload_file uses it for the file name/type
+        self._queue = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+        self._buffer = bytearray()
+        self._eof = False
+    
+    async def feed(self, chunk):
+        """Add a downloaded chunk (None marks the end)"""
+        await self._queue.put(chunk)
+    
+    async def read(self, n: int = -1) -> bytes:
+        while not self._eof and (n < 0 or len(self._buffer) < n):
+            chunk = await self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        
+        if n < 0:
+            n = len(self._buffer)
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+async def stream_media(msg, size: int, name: str):
+    """Upload a document while it downloads - no temp file, bounded memory"""
+    stream = MediaStream(name)
+    
+    async def produce():
+        async for chunk in userbot.iter_download(msg.media, request_size=DOWNLOAD_PART_SIZE):
+            await stream.feed(chunk)
+        await stream.feed(None)
+    
+    producer = asyncio.create_task(produce())
+    uploader = asyncio.create_task(
+        next_upload_client().upload_file(stream, file_size=size, file_name=name)
+    )
+    try:
+        # Whichever side fails first aborts the other
+        done, _ = await asyncio.wait({producer, uploader}, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        return await uploader
+    finally:
+        producer.cancel()
+        uploader.cancel()
+
+def is_protected(msg) -> bool:
+    """Check if the source chat restricts saving/forwarding its content"""
+    return bool(msg.noforwards or getattr(msg.chat, 'noforwards', False))
+
+async def download_media_file(msg, temp_dir: str, stream: bool = False):
     """
-    PURE DOWNLOAD-UPLOAD - NO FORWARDING CODE
-    - Downloads media to temp file
-    - Uploads as fresh file (video format preserved)
-    - NO CAPTION
-    - Deletes temp file
+    Fetch message media for upload
+    - Unprotected source: returns msg.media (re-sent by reference, no download)
+    - Source media uploaded before: returns our InputPhoto/InputDocument (no download)
+    - Small media: downloads into memory (io.BytesIO)
+    - Large documents with stream=True: uploads while downloading, returns the InputFile
+    - Other large media: downloads to a temp file and returns its path
+    - Returns None on failure; FloodWaitError is re-raised for the caller
     """
-    temp_file = None
+    if not is_protected(msg):
+        return msg.media
+    
+    # Same photo/document already uploaded: reuse our copy, skip the download
+    cached = await lookup_sent_media(source_key(msg))
+    if cached is not None:
+        return cached
+    
+    ext = media_extension(msg)
+    size = msg.file.size if msg.file else None
+    await dl_bucket.acquire()
+    
+    if stream and msg.document and size and size > MEMORY_BUFFER_LIMIT:
+        try:
+            log.info(f"  📥📤 Streaming #{msg.id}...")
+            return await stream_media(msg, size, f"media_{msg.id}{ext}")
+        except FloodWaitError as e:
+            dl_bucket.pause(e.seconds)
+            tg_bucket.pause(e.seconds)
+            raise  # Re-raise to be handled by caller
+        except Exception as e:
+            log.error(f"  ❌ Stream error #{msg.id}: {e}")
+            return None
+    
+    if size and size <= MEMORY_BUFFER_LIMIT:
+        target = io.BytesIO()
+        target.name = f"media_{msg.id}{ext}"  # Lets Telethon detect the media type
+    else:
+        # Unique temp file path with proper extension
+        target = f"{temp_dir}{os.sep}media_{msg.id}_{next(_tmp_counter)}{ext}"
+    
     try:
-        # Get message
-        msg = await userbot.get_messages(source_chat_id, ids=msg_id)
-        
-        if not msg or not msg.media:
-            return False
-        
-        # Skip unsupported media types
-        if isinstance(msg.media, (MessageMediaWebPage, MessageMediaUnsupported)):
-            return False
-        
-        # Generate temp file path with proper extension
-        timestamp = int(time.time() * 1000)
-        
-        # Determine file extension
-        if msg.photo:
-            ext = ".jpg"
-        elif msg.video:
-            ext = ".mp4"
-        elif msg.document:
-            if hasattr(msg.document, 'attributes'):
-                for attr in msg.document.attributes:
-                    if hasattr(attr, 'file_name') and attr.file_name:
-                        ext = os.path.splitext(attr.file_name)[1] or ".bin"
-                        break
-                else:
-                    ext = ".bin"
-            else:
-                ext = ".bin"
+        log.info(f"  📥 Downloading #{msg.id}...")
+        if isinstance(target, str) and msg.document and size and DOWNLOAD_WORKERS > 1:
+            result = await parallel_download(msg, target, size)
         else:
-            ext = ".bin"
+            result = await userbot.download_media(msg.media, file=target)
         
-        temp_file = os.path.join(temp_dir, f"media_{msg_id}_{timestamp}{ext}")
+        if not result:
+            log.error(f"  ❌ Download failed")
+            return None
         
-        # STEP 1: Download media to local file
-        print(f"  📥 Downloading #{msg_id}...")
-        downloaded_path = await userbot.download_media(msg.media, file=temp_file)
+        if isinstance(result, io.BytesIO):
+            result.seek(0)
+        return result
         
-        if not downloaded_path or not os.path.exists(downloaded_path):
-            print(f"  ❌ Download failed")
-            return False
+    except FloodWaitError as e:
+        dl_bucket.pause(e.seconds)
+        await discard_media(target)
+        raise  # Re-raise to be handled by caller
+    except Exception as e:
+        log.error(f"  ❌ Download error #{msg.id}: {e}")
+        await discard_media(target)
+        return None
+
+def _safe_unlink(path: str) -> bool:
+    """Remove a file in one syscall, ignoring if it's already gone"""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+        return True
+    return False
+
+async def discard_media(media):
+    """Delete the temp file behind downloaded media (no-op for memory/reference)"""
+    if not isinstance(media, str):
+        return
+    try:
+        if await asyncio.to_thread(_safe_unlink, media):
+            log.info(f"  🗑️  Deleted temp file")
+    except OSError as e:
+        log.warning(f"  ⚠️ Could not delete {media}: {e}")
+
+def source_key(msg) -> str:
+    """Duplicate-detection key from Telegram's own photo/document id"""
+    if msg.photo:
+        return f"photo:{msg.photo.id}"
+    return f"doc:{msg.document.id}"
+
+def _hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256")
+    return f"sha256:{os.path.getsize(path)}:{digest.hexdigest()}"
+
+async def content_key(media):
+    """Duplicate-detection key (full sha256) for downloaded media, None for references/streams"""
+    if isinstance(media, io.BytesIO):
+        with media.getbuffer() as buffer:
+            return f"sha256:{len(buffer)}:{hashlib.sha256(buffer).hexdigest()}"
+    if isinstance(media, str):
+        return await asyncio.to_thread(_hash_file, media)
+    return None
+
+@contextlib.asynccontextmanager
+async def owned_media(media):
+    """Own fetched media for the block, its temp file is deleted on exit"""
+    try:
+        yield media
+    finally:
+        await discard_media(media)
+
+async def resend_duplicate(msg, key: str) -> bool:
+    """Re-send media already in TARGET_CHANNEL by reference (no bytes uploaded)"""
+    cached = await lookup_sent_media(key)
+    if cached is None:
+        return False
+    try:
+        await next_upload_client().send_file(target_peer, cached, caption="")
+    except (FileReferenceExpiredError, MediaEmptyError):
+        await forget_sent_media(key)
+        return False
+    log.info(f"  ♻️ Duplicate #{msg.id} re-sent by reference")
+    return True
+
+async def send_fresh(msg, media):
+    """Upload media as a FRESH file, returns the sent message"""
+    # Upload settings based on media type
+    if msg.video:
+        # Video upload - preserve video format
+        return await next_upload_client().send_file(
+            target_peer,
+            media,
+            caption="",  # NO CAPTION
+            force_document=False,  # Keep as video, not document
+            supports_streaming=True,  # Enable video streaming
+            video_note=False,  # Regular video, not round video
+            attributes=None  # Remove original attributes
+        )
+    elif msg.photo:
+        # Photo upload
+        return await next_upload_client().send_file(
+            target_peer,
+            media,
+            caption="",  # NO CAPTION
+            force_document=False,
+            attributes=None
+        )
+    else:
+        # Document/other media
+        return await next_upload_client().send_file(
+            target_peer,
+            media,
+            caption="",  # NO CAPTION
+            force_document=False,
+            attributes=None
+        )
+
+async def upload_media_file(msg, media) -> bool:
+    """
+    Send media returned by download_media_file to TARGET_CHANNEL
+    - msg.media / our earlier upload: re-sent by reference, original attributes kept
+    - Downloaded media: uploaded as FRESH media, video format preserved, attributes dropped
+    - NO CAPTION
+    - FloodWaitError is re-raised for the caller
+    """
+    try:
+        await tg_bucket.acquire()
+        log.info(f"  📤 Uploading #{msg.id}...")
         
-        # STEP 2: Read file as bytes (completely fresh upload)
-        with open(downloaded_path, 'rb') as f:
-            file_bytes = f.read()
+        if media is msg.media:
+            # Re-send by reference - no bytes transferred, no forward header
+            try:
+                await next_upload_client().send_file(target_peer, media, caption="")
+            except ChatForwardsRestrictedError:
+                # Protection wasn't visible on the message, fall back to download
+                msg.noforwards = True
+                async with owned_media(await download_media_file(msg, TEMP_DIR)) as media:
+                    if not media:
+                        return False
+                    return await upload_media_file(msg, media)
         
-        # STEP 3: Upload as FRESH file
-        print(f"  📤 Uploading #{msg_id}...")
+        elif isinstance(media, (InputPhoto, InputDocument)):
+            # Our earlier upload of the same source media
+            try:
+                await next_upload_client().send_file(target_peer, media, caption="")
+            except (FileReferenceExpiredError, MediaEmptyError):
+                await forget_sent_media(source_key(msg))
+                async with owned_media(await download_media_file(msg, TEMP_DIR)) as media:
+                    if not media:
+                        return False
+                    return await upload_media_file(msg, media)
+            log.info(f"  ♻️ Duplicate #{msg.id} re-sent by reference")
+            return True
         
-        # Upload settings based on media type
-        if msg.video:
-            # Video upload - preserve video format
-            await userbot.send_file(
-                TARGET_CHANNEL,
-                file_bytes,
-                caption="",  # NO CAPTION
-                force_document=False,  # Keep as video, not document
-                supports_streaming=True,  # Enable video streaming
-                video_note=False,  # Regular video, not round video
-                attributes=None  # Remove original attributes
-            )
-        elif msg.photo:
-            # Photo upload
-            await userbot.send_file(
-                TARGET_CHANNEL,
-                file_bytes,
-                caption="",  # NO CAPTION
-                force_document=False,
-                attributes=None
-            )
         else:
-            # Document/other media
-            await userbot.send_file(
-                TARGET_CHANNEL,
-                file_bytes,
-                caption="",  # NO CAPTION
-                force_document=False,
-                attributes=None
-            )
+            key = await content_key(media)
+            if key and await resend_duplicate(msg, key):
+                return True
+            
+            sent = await send_fresh(msg, media)
+            try:
+                for cache_key in (key, source_key(msg)):
+                    if cache_key:
+                        await remember_sent_media(cache_key, sent.media)
+            except Exception as e:
+                # Already uploaded - never let the cache turn this into a retry
+                log.warning(f"  ⚠️ Could not cache #{msg.id}: {e}")
         
-        print(f"  ✅ Uploaded #{msg_id}")
+        log.info(f"  ✅ Uploaded #{msg.id}")
+        return True
         
-        # STEP 4: Delete temp file
-        if os.path.exists(downloaded_path):
-            os.remove(downloaded_path)
-            print(f"  🗑️  Deleted temp file")
+    except FloodWaitError as e:
+        tg_bucket.pause(e.seconds)
+        raise  # Re-raise to be handled by caller
+    except Exception as e:
+        log.error(f"  ❌ Upload error #{msg.id}: {e}")
+        return False
+    finally:
+        if isinstance(media, io.BytesIO):
+            media.seek(0)  # Ready for a retry
+
+async def download_and_upload_media(msg, temp_dir: str) -> bool:
+    """
+    Copy one message's media to TARGET_CHANNEL - NO FORWARD HEADER
+    - Takes an already-fetched message (no extra get_messages RPC)
+    - Unprotected source: re-sent by reference, original attributes kept
+    - Protected source: downloaded (memory, temp file, or streamed) and uploaded as a fresh file
+    - NO CAPTION
+    - Deletes temp file
+    """
+    try:
+        if not has_uploadable_media(msg):
+            return False
         
-        return True
+        # STEP 1: Fetch media (STEP 3, deleting the temp file, runs on exit)
+        async with owned_media(await download_media_file(msg, temp_dir, stream=True)) as media:
+            if not media:
+                return False
+            
+            # STEP 2: Upload as FRESH file
+            return await upload_media_file(msg, media)
         
     except FloodWaitError as e:
         raise  # Re-raise to be handled by caller
     except Exception as e:
-        print(f"  ❌ Error #{msg_id}: {e}")
-        # Cleanup
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-            except:
-                pass
+        log.error(f"  ❌ Error #{msg.id}: {e}")
         return False
 
 # ==================== DOWNLOAD-UPLOAD RANGE ====================
 async def download_upload_range(chat_id: int, chat_name: str, start_id: int, end_id: int, status_msg):
-    """Download & upload media range"""
+    """
+    Download & upload media range
+    - Producer fetches messages and prefetches up to PREFETCH_DEPTH downloads
+    - Consumer uploads them in message order while the next ones download
+    """
     
     if start_id > end_id:
         start_id, end_id = end_id, start_id
     
-    total_uploaded = 0
-    total_skipped = 0
-    total_failed = 0
-    message_id = start_id
+    stats = {"uploaded": 0, "skipped": 0, "failed": 0}
+    queue = asyncio.Queue(maxsize=PREFETCH_DEPTH)
+    download_slots = asyncio.Semaphore(PREFETCH_DEPTH)
     
-    await status_msg.edit_text(
+    editor = ThrottledEditor(status_msg)
+    editor.set_text(
         f"📥 **Download & Upload Started**\n"
         f"📢 {chat_name}\n"
         f"🆔 `{chat_id}`\n\n"
@@ -247,169 +876,269 @@ async def download_upload_range(chat_id: int, chat_name: str, start_id: int, end
         f"🚀 Progress: 0 uploaded..."
     )
     
-    while message_id <= end_id:
-        try:
-            # Get message
-            msg = await userbot.get_messages(chat_id, ids=message_id)
+    async def rate_limited(seconds: int, message_id: int):
+        log.warning(f"⏳ FloodWait {seconds}s at #{message_id}")
+        await editor.flush(
+            f"⏳ **Rate Limited**\n"
+            f"⏰ Waiting {seconds}s...\n\n"
+            f"✅ Uploaded: {stats['uploaded']}\n"
+            f"📍 Current: #{message_id}/{end_id}"
+        )
+        await asyncio.sleep(seconds)
+    
+    async def prefetch(msg):
+        """Download one message's media with retries"""
+        async with download_slots:
+            retry_count = 0
+            while retry_count < MAX_RETRIES:
+                try:
+                    media = await download_media_file(msg, TEMP_DIR)
+                except FloodWaitError as e:
+                    await rate_limited(e.seconds, msg.id)
+                    continue
+                
+                if media:
+                    return media
+                
+                retry_count += 1
+                if retry_count < MAX_RETRIES:
+                    log.warning(f"⚠️ Retry {retry_count}/{MAX_RETRIES} for #{msg.id}")
+                    await asyncio.sleep(2)
+            return None
+    
+    def report_progress(message_id: int):
+        # Coalesced by the editor, so every queued item can report
+        editor.set_text(
+            f"⏳ **Processing...**\n"
+            f"📢 {chat_name}\n"
+            f"📍 Current: #{message_id}/{end_id}\n"
+            f"✅ Uploaded: {stats['uploaded']}\n"
+            f"⏭️ Skipped: {stats['skipped']}\n"
+            f"❌ Failed: {stats['failed']}"
+        )
+    
+    async def producer(tg):
+        for batch_start in range(start_id, end_id + 1, FETCH_BATCH_SIZE):
+            batch_ids = list(range(batch_start, min(batch_start + FETCH_BATCH_SIZE, end_id + 1)))
             
-            if msg is None or isinstance(msg, MessageService):
-                message_id += 1
-                total_skipped += 1
-                continue
+            msgs = None
+            retry_count = 0
+            while retry_count < MAX_RETRIES:
+                try:
+                    msgs = await userbot.get_messages(chat_id, ids=batch_ids)
+                    break
+                except FloodWaitError as e:
+                    dl_bucket.pause(e.seconds)
+                    await rate_limited(e.seconds, batch_start)
+                except Exception as e:
+                    retry_count += 1
+                    log.error(f"❌ Error at #{batch_start}-#{batch_ids[-1]}: {e}")
+                    if retry_count < MAX_RETRIES:
+                        log.warning(f"⚠️ Retry {retry_count}/{MAX_RETRIES} for #{batch_start}-#{batch_ids[-1]}")
+                        await asyncio.sleep(2)
             
-            if not msg.media:
-                message_id += 1
-                total_skipped += 1
+            if msgs is None:
+                # Unknown whether these held media - report them as lost, not skipped
+                stats["failed"] += len(batch_ids)
+                log.error(f"❌ Failed after {MAX_RETRIES} retries: #{batch_start}-#{batch_ids[-1]}")
+                report_progress(batch_ids[-1])
                 continue
             
-            if isinstance(msg.media, (MessageMediaWebPage, MessageMediaUnsupported)):
-                message_id += 1
-                total_skipped += 1
+            to_upload = [msg for msg in msgs if has_uploadable_media(msg)]
+            stats["skipped"] += len(batch_ids) - len(to_upload)
+            
+            for msg in to_upload:
+                # Queue holds download tasks in message order
+                await queue.put((msg, tg.create_task(prefetch(msg))))
+                report_progress(msg.id)
+            
+            report_progress(batch_ids[-1])
+        
+        await queue.put(None)
+    
+    async def consumer():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            
+            msg, download = item
+            media = await download
+            if not media:
+                stats["failed"] += 1
+                log.error(f"❌ Failed after {MAX_RETRIES} retries: #{msg.id}")
                 continue
             
-            # Process media
-            if msg.photo or msg.document or msg.video:
+            async with owned_media(media):
                 retry_count = 0
                 success = False
                 
                 while retry_count < MAX_RETRIES and not success:
                     try:
-                        success = await download_and_upload_media(chat_id, message_id, TEMP_DIR)
-                        
-                        if success:
-                            total_uploaded += 1
-                        else:
-                            retry_count += 1
-                            if retry_count < MAX_RETRIES:
-                                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} for #{message_id}")
-                                await asyncio.sleep(2)
-                            else:
-                                total_failed += 1
-                                print(f"❌ Failed after {MAX_RETRIES} retries: #{message_id}")
-                    
+                        success = await upload_media_file(msg, media)
                     except FloodWaitError as e:
-                        print(f"⏳ FloodWait {e.seconds}s at #{message_id}")
-                        await status_msg.edit_text(
-                            f"⏳ **Rate Limited**\n"
-                            f"⏰ Waiting {e.seconds}s...\n\n"
-                            f"✅ Uploaded: {total_uploaded}\n"
-                            f"📍 Current: #{message_id}/{end_id}"
-                        )
-                        await asyncio.sleep(e.seconds)
-            else:
-                total_skipped += 1
-            
-            # Update status every 10 messages
-            if message_id % 10 == 0:
-                try:
-                    await status_msg.edit_text(
-                        f"⏳ **Processing...**\n"
-                        f"📢 {chat_name}\n"
-                        f"📍 Current: #{message_id}/{end_id}\n"
-                        f"✅ Uploaded: {total_uploaded}\n"
-                        f"⏭️ Skipped: {total_skipped}\n"
-                        f"❌ Failed: {total_failed}"
-                    )
-                except:
-                    pass
-            
-            await asyncio.sleep(UPLOAD_DELAY)
-            message_id += 1
-            
-        except FloodWaitError as e:
-            await status_msg.edit_text(
-                f"⏳ **Rate Limited**\n"
-                f"⏰ Waiting {e.seconds}s...\n\n"
-                f"✅ Uploaded: {total_uploaded}\n"
-                f"📍 Resuming at: #{message_id}"
-            )
-            await asyncio.sleep(e.seconds)
-            
-        except Exception as e:
-            print(f"❌ Error at #{message_id}: {e}")
-            message_id += 1
-            total_skipped += 1
+                        await rate_limited(e.seconds, msg.id)
+                        continue
+                    
+                    if not success:
+                        retry_count += 1
+                        if retry_count < MAX_RETRIES:
+                            log.warning(f"⚠️ Retry {retry_count}/{MAX_RETRIES} for #{msg.id}")
+                            await asyncio.sleep(2)
+                
+                if success:
+                    stats["uploaded"] += 1
+                else:
+                    stats["failed"] += 1
+                    log.error(f"❌ Failed after {MAX_RETRIES} retries: #{msg.id}")
+    
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(producer(tg))
+            tg.create_task(consumer())
+    except BaseException:
+        editor.cancel()
+        raise
     
-    await status_msg.edit_text(
+    await editor.close(
         f"✅ **Complete!**\n\n"
         f"📢 {chat_name}\n"
-        f"✅ Uploaded: {total_uploaded}\n"
-        f"⏭️ Skipped: {total_skipped}\n"
-        f"❌ Failed: {total_failed}\n"
+        f"✅ Uploaded: {stats['uploaded']}\n"
+        f"⏭️ Skipped: {stats['skipped']}\n"
+        f"❌ Failed: {stats['failed']}\n"
         f"📍 Range: #{start_id} → #{end_id}"
     )
     
     return chat_id, chat_name, end_id
 
-# ==================== MONITOR CHANNEL ====================
-async def monitor_channel_for_new_media(chat_id: int, chat_name: str, last_msg_id: int):
-    """Monitor channel for new media"""
-    
-    print(f"\n{'='*60}")
-    print(f"🔔 MONITORING: {chat_name}")
-    print(f"{'='*60}\n")
+# ==================== MONITOR CHANNELS ====================
+monitor_queue = asyncio.Queue()  # Chat ids waiting for a sync
+
+def schedule_sync(chat_id: int, latest_msg_id: int):
+    """Record newest known message id for a channel and queue a sync"""
+    entry = monitoring_channels.get(chat_id)
+    if entry is None:
+        return
     
-    current_last_id = last_msg_id
+    entry["target_msg_id"] = max(entry.get("target_msg_id", 0), latest_msg_id)
+    if not entry.get("queued"):
+        entry["queued"] = True
+        monitor_queue.put_nowait(chat_id)
+
+async def on_new_message(event):
+    """Push update from Telegram - queue a sync for monitored channels"""
+    # Users, basic groups and channels share unmarked ids - only channels are monitored
+    if not isinstance(event.message.peer_id, PeerChannel) or not has_uploadable_media(event.message):
+        return
+    chat_id = event.message.peer_id.channel_id
+    schedule_sync(chat_id, event.message.id)
+
+async def catch_up_channel(chat_id: int):
+    """Queue a sync up to the channel's latest message (missed while offline)"""
+    try:
+        messages = await userbot.get_messages(chat_id, limit=1)
+    except Exception as e:
+        log.error(f"❌ Catch-up error {chat_id}: {e}")
+        return
+    if messages:
+        schedule_sync(chat_id, messages[0].id)
+
+async def check_joined(chat_id: int) -> bool:
+    """Telegram only pushes updates for joined channels - mark the rest for polling"""
+    try:
+        entity = await userbot.get_entity(chat_id)
+        joined = not getattr(entity, "left", False)
+    except Exception as e:
+        log.warning(f"⚠️ Join check failed {chat_id}: {e}")
+        joined = False  # Polling a joined channel is only wasteful, missing one is not
     
+    entry = monitoring_channels.get(chat_id)
+    if entry is not None:
+        entry["poll"] = not joined
+        if not joined:
+            log.warning(f"⚠️ Not joined {entry['name']} - polling every {UNJOINED_POLL_INTERVAL}s")
+    return joined
+
+async def poll_unjoined():
+    """Catch up channels marked for polling every UNJOINED_POLL_INTERVAL"""
     while True:
+        await asyncio.sleep(UNJOINED_POLL_INTERVAL)
+        for chat_id, entry in list(monitoring_channels.items()):
+            if entry.get("poll"):
+                await catch_up_channel(chat_id)
+
+async def sync_channel(chat_id: int, entry: dict):
+    """Upload new media between last_msg_id and target_msg_id"""
+    new_count = 0
+    
+    while entry["last_msg_id"] < entry["target_msg_id"]:
+        batch_start = entry["last_msg_id"] + 1
+        batch_ids = list(range(batch_start, min(batch_start + FETCH_BATCH_SIZE, entry["target_msg_id"] + 1)))
+        
         try:
-            if chat_id not in monitoring_channels:
-                print(f"❌ STOPPED: {chat_name}\n")
-                break
+            msgs = await userbot.get_messages(chat_id, ids=batch_ids)
+        except FloodWaitError as e:
+            dl_bucket.pause(e.seconds)
+            await asyncio.sleep(e.seconds)
+            continue
+        
+        to_upload = [msg for msg in msgs if has_uploadable_media(msg)]
+        for msg in to_upload:
+            if await is_seen(chat_id, msg.id):
+                continue
             
-            messages = await userbot.get_messages(chat_id, limit=1)
-            if messages:
-                latest_msg_id = messages[0].id
+            try:
+                retry_count = 0
+                success = False
                 
-                if latest_msg_id > current_last_id:
-                    new_count = 0
-                    
-                    for msg_id in range(current_last_id + 1, latest_msg_id + 1):
-                        if chat_id not in monitoring_channels:
-                            break
-                        
-                        try:
-                            msg = await userbot.get_messages(chat_id, ids=msg_id)
-                            
-                            if msg and msg.media:
-                                if not isinstance(msg.media, (MessageMediaWebPage, MessageMediaUnsupported)):
-                                    if msg.photo or msg.document or msg.video:
-                                        retry_count = 0
-                                        success = False
-                                        
-                                        while retry_count < MAX_RETRIES and not success:
-                                            try:
-                                                success = await download_and_upload_media(chat_id, msg_id, TEMP_DIR)
-                                                
-                                                if success:
-                                                    media_type = '📷' if msg.photo else '📄' if msg.document else '🎬'
-                                                    print(f"🚀 NEW MEDIA! #{msg_id} {media_type}")
-                                                    new_count += 1
-                                                else:
-                                                    retry_count += 1
-                                                    if retry_count < MAX_RETRIES:
-                                                        await asyncio.sleep(2)
-                                            
-                                            except FloodWaitError as e:
-                                                await asyncio.sleep(e.seconds)
-                                        
-                                        await asyncio.sleep(2)
+                while retry_count < MAX_RETRIES and not success:
+                    try:
+                        success = await download_and_upload_media(msg, TEMP_DIR)
                         
-                        except FloodWaitError as e:
-                            await asyncio.sleep(e.seconds)
-                        except Exception as e:
-                            print(f"❌ Monitor error #{msg_id}: {e}")
-                    
-                    current_last_id = latest_msg_id
+                        if success:
+                            await mark_seen(chat_id, msg.id)
+                            media_type = '📷' if msg.photo else '📄' if msg.document else '🎬'
+                            log.info(f"🚀 NEW MEDIA! #{msg.id} {media_type}")
+                            new_count += 1
+                        else:
+                            retry_count += 1
+                            if retry_count < MAX_RETRIES:
+                                await asyncio.sleep(2)
                     
-                    if new_count > 0:
-                        print(f"✅ Processed: {new_count} new media\n")
-            
-            await asyncio.sleep(10)
+                    except FloodWaitError as e:
+                        # Bucket already paused by the failing download/upload
+                        await asyncio.sleep(e.seconds)
             
+            except Exception as e:
+                log.error(f"❌ Monitor error #{msg.id}: {e}")
+        
+        entry["last_msg_id"] = batch_ids[-1]
+        _dirty_channels.add(chat_id)
+    
+    if new_count > 0:
+        log.info(f"✅ Processed: {new_count} new media from {entry['name']}\n")
+
+async def monitor_worker():
+    """Sync queued channels; MONITOR_WORKERS of these share monitor_queue"""
+    while True:
+        chat_id = await monitor_queue.get()
+        entry = monitoring_channels.get(chat_id)
+        if entry is None:
+            continue
+        
+        # Cleared first so events arriving mid-sync queue another pass
+        entry["queued"] = False
+        if entry.get("syncing"):
+            # The running sync re-reads target_msg_id before it stops
+            continue
+        
+        entry["syncing"] = True
+        try:
+            await sync_channel(chat_id, entry)
         except Exception as e:
-            print(f"❌ Monitor error: {e}")
-            await asyncio.sleep(10)
+            log.error(f"❌ Monitor error {entry['name']}: {e}")
+        finally:
+            entry["syncing"] = False
 
 # ==================== BOT COMMANDS ====================
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -430,8 +1159,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"⚙️ **Settings:**\n"
         f"Upload delay: {UPLOAD_DELAY}s\n"
         f"Max retries: {MAX_RETRIES}\n\n"
-        "🔥 **Pure Download-Upload**\n"
-        "❌ No forwarding\n"
+        "♻️ Unprotected media: re-sent by reference\n"
+        "📥 Protected media: downloaded & re-uploaded\n"
+        "❌ No forward header\n"
         "❌ No captions\n"
         "✅ Video format preserved"
     )
@@ -442,17 +1172,14 @@ async def channels_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Unauthorized")
         return
     
-    db = load_monitoring_db()
-    
-    if not db:
+    if not monitoring_channels:
         await update.message.reply_text("❌ No channels monitored")
         return
     
     text = "📊 **Monitoring:**\n\n"
     
-    for chat_id, data in db.items():
-        chat_id_int = int(chat_id)
-        status = "🟢" if chat_id_int in monitoring_channels else "⚪"
+    for chat_id, data in monitoring_channels.items():
+        status = "🔄" if data.get("queued") else "🟡" if data.get("poll") else "🟢"  # 🟡 not joined, polled
         
         text += f"{status} **{data['name']}**\n"
         text += f"   🆔 `{chat_id}`\n"
@@ -461,170 +1188,255 @@ async def channels_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(text)
 
-async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle user input"""
-    if update.effective_user.id != OWNER_ID:
+async def _handle_source(update: Update, session: UserSession, link: str):
+    """STEP 1: Source channel"""
+    processing = await update.message.reply_text("🔍 Extracting channel...")
+    chat, _ = parse_link(link)
+    chat_id, result = await resolve_entity(chat) if chat else (None, None)
+    
+    if not chat_id:
+        await processing.edit_text(f"❌ Invalid link")
         return
     
-    user_id = update.effective_user.id
-    link = update.message.text.strip()
+    session.source_chat_id = chat_id
+    session.source_chat_name = result
+    session.step = Step.START
     
-    if user_id not in user_sessions:
-        user_sessions[user_id] = {"step": 0}
+    await processing.edit_text(
+        f"✅ Channel: {result}\n\n"
+        f"Send START message link"
+    )
+
+async def _range_msg_id(update: Update, session: UserSession, link: str):
+    """Message id from a START/END link in the source channel, or None (user told why)"""
+    chat, msg_id = parse_link(link)
     
-    session = user_sessions[user_id]
+    if not msg_id:
+        await update.message.reply_text("❌ Invalid message ID")
+        return None
     
-    # STEP 1: Source channel
-    if session["step"] == 0:
-        processing = await update.message.reply_text("🔍 Extracting channel...")
-        chat_id, result, msg_id = await get_message_ids(link)
-        
-        if not chat_id:
-            await processing.edit_text(f"❌ Invalid link")
-            return
-        
-        session["source_chat_id"] = chat_id
-        session["source_chat_name"] = result
-        session["step"] = 1
-        
-        await processing.edit_text(
-            f"✅ Channel: {result}\n\n"
-            f"Send START message link"
-        )
+    if not await is_same_chat(chat, session.source_chat_id):
+        await update.message.reply_text("❌ Link is from a different channel")
+        return None
     
-    # STEP 2: Start message
-    elif session["step"] == 1:
-        chat_id, result, start_msg_id = await get_message_ids(link)
-        
-        if not start_msg_id:
-            await update.message.reply_text("❌ Invalid message ID")
-            return
-        
-        session["start_msg_id"] = start_msg_id
-        session["step"] = 2
-        
-        await update.message.reply_text(
-            f"✅ Start: #{start_msg_id}\n\n"
-            f"Send END message link"
-        )
+    return msg_id
+
+async def _handle_start(update: Update, session: UserSession, link: str):
+    """STEP 2: Start message"""
+    start_msg_id = await _range_msg_id(update, session, link)
+    if not start_msg_id:
+        return
     
-    # STEP 3: End message
-    elif session["step"] == 2:
-        chat_id, result, end_msg_id = await get_message_ids(link)
-        
-        if not end_msg_id:
-            await update.message.reply_text("❌ Invalid message ID")
-            return
-        
-        source_chat_id = session["source_chat_id"]
-        source_chat_name = session["source_chat_name"]
-        start_msg_id = session["start_msg_id"]
-        
-        status_msg = await update.message.reply_text(
-            f"⏳ **Starting...**\n\n"
-            f"📢 {source_chat_name}\n"
-            f"📍 #{start_msg_id} → #{end_msg_id}"
-        )
-        
-        # Download & upload
-        final_chat_id, final_chat_name, final_last_id = await download_upload_range(
-            source_chat_id, 
-            source_chat_name, 
-            start_msg_id, 
-            end_msg_id, 
-            status_msg
-        )
-        
-        # Add to monitoring
+    session.start_msg_id = start_msg_id
+    session.step = Step.END
+    
+    await update.message.reply_text(
+        f"✅ Start: #{start_msg_id}\n\n"
+        f"Send END message link"
+    )
+
+async def _handle_end(update: Update, session: UserSession, link: str):
+    """STEP 3: End message - run the range, then monitor the channel"""
+    end_msg_id = await _range_msg_id(update, session, link)
+    if not end_msg_id:
+        return
+    
+    source_chat_id = session.source_chat_id
+    source_chat_name = session.source_chat_name
+    start_msg_id = session.start_msg_id
+    
+    status_msg = await update.message.reply_text(
+        f"⏳ **Starting...**\n\n"
+        f"📢 {source_chat_name}\n"
+        f"📍 #{start_msg_id} → #{end_msg_id}"
+    )
+    
+    # Download & upload
+    final_chat_id, final_chat_name, final_last_id = await download_upload_range(
+        source_chat_id, 
+        source_chat_name, 
+        start_msg_id, 
+        end_msg_id, 
+        status_msg
+    )
+    
+    # Add to monitoring - no await until the entry exists, so no lock needed
+    entry = monitoring_channels.get(final_chat_id)
+    if entry is not None:
+        # Already monitored: only move the cursor forward, never re-add
+        if final_last_id > entry["last_msg_id"]:
+            entry["last_msg_id"] = final_last_id
+            _dirty_channels.add(final_chat_id)
+    else:
         add_monitoring_channel(final_chat_id, final_chat_name, final_last_id)
         
-        # Start monitoring
-        if final_chat_id not in monitoring_channels:
-            monitoring_channels[final_chat_id] = {
-                "name": final_chat_name,
-                "last_msg_id": final_last_id,
-                "task": None
-            }
-            
-            task = asyncio.create_task(
-                monitor_channel_for_new_media(final_chat_id, final_chat_name, final_last_id)
-            )
-            monitoring_channels[final_chat_id]["task"] = task
-            
-            await status_msg.edit_text(
-                f"✅ **Complete!**\n\n"
-                f"📢 {final_chat_name}\n"
-                f"📍 #{start_msg_id} → #{end_msg_id}\n\n"
-                f"🔔 Monitoring..."
-            )
+        # Start monitoring (pick up anything posted after the range)
+        log.info(f"🔔 MONITORING: {final_chat_name}")
+        joined = await check_joined(final_chat_id)
+        await catch_up_channel(final_chat_id)
         
-        user_sessions[user_id] = {"step": 0}
+        await status_msg.edit_text(
+            f"✅ **Complete!**\n\n"
+            f"📢 {final_chat_name}\n"
+            f"📍 #{start_msg_id} → #{end_msg_id}\n\n"
+            + ("🔔 Monitoring..." if joined else
+               f"🔔 Monitoring...\n⚠️ Channel not joined - no live updates, polling every {UNJOINED_POLL_INTERVAL}s")
+        )
+    
+    user_sessions[update.effective_user.id] = UserSession()
+
+STEP_HANDLERS = {
+    Step.SOURCE: _handle_source,
+    Step.START: _handle_start,
+    Step.END: _handle_end,
+}
+
+async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle user input"""
+    if update.effective_user.id != OWNER_ID:
+        return
+    
+    user_id = update.effective_user.id
+    link = update.message.text.strip()
+    
+    session = user_sessions.get(user_id)
+    if session is None:
+        session = user_sessions[user_id] = UserSession()
+    
+    await STEP_HANDLERS[session.step](update, session, link)
 
 # ==================== START USERBOT ====================
 async def start_userbot():
-    """Start userbot"""
+    """Start userbot and extra upload connections"""
+    global target_peer
+    
+    # Telethon uses cryptg automatically; without it MTProto AES runs in pure Python
+    try:
+        import cryptg  # noqa: F401
+        log.info("✅ cryptg: fast MTProto encryption enabled")
+    except ImportError:
+        log.warning("⚠️ cryptg not installed - transfers will be CPU-bound (pip install cryptg)")
+    
     await userbot.start()
     me = await userbot.get_me()
-    print(f"✅ UserBot: {me.first_name} (@{me.username or 'no username'})")
+    log.info(f"✅ UserBot: {me.first_name} (@{me.username or 'no username'})")
+    
+    target_peer = await userbot.get_input_entity(TARGET_CHANNEL)
+    
+    for _ in range(UPLOAD_CLIENTS - 1):
+        client = TelegramClient(
+            StringSession(SESSION_STRING),
+            API_ID,
+            API_HASH,
+            receive_updates=False  # Primary client handles events
+        )
+        await client.connect()
+        upload_clients.append(client)
+    
+    if len(upload_clients) > 1:
+        log.info(f"✅ Transfer connections: {len(upload_clients)}")
+
+async def stop_userbot():
+    """Disconnect userbot and extra upload connections"""
+    for client in upload_clients:
+        await client.disconnect()
 
 # ==================== RESTORE MONITORING ====================
 async def restore_monitoring():
     """Restore monitoring on startup"""
-    db = load_monitoring_db()
+    db = await load_monitoring_db()
     
     for chat_id, data in db.items():
-        chat_id_int = int(chat_id)
+        if chat_id not in monitoring_channels:
+            monitoring_channels[chat_id] = dict(data)
+            await check_joined(chat_id)
+            await catch_up_channel(chat_id)
+            log.info(f"✅ Monitoring: {data['name']}")
+    
+    # Single handler - new channels are picked up via monitoring_channels
+    userbot.add_event_handler(on_new_message, events.NewMessage())
+
+# ==================== SUPERVISOR ====================
+async def supervise(name: str, worker):
+    """Run a background worker forever, restarting it with backoff on crashes"""
+    delay = 1
+    while True:
+        started = time.monotonic()
+        try:
+            await worker()
+        except Exception as e:
+            log.error(f"❌ {name} crashed: {e}")
         
-        if chat_id_int not in monitoring_channels:
-            monitoring_channels[chat_id_int] = {
-                "name": data["name"],
-                "last_msg_id": data["last_msg_id"],
-                "task": None
-            }
-            
-            task = asyncio.create_task(
-                monitor_channel_for_new_media(chat_id_int, data["name"], data["last_msg_id"])
-            )
-            monitoring_channels[chat_id_int]["task"] = task
-            
-            print(f"✅ Monitoring: {data['name']}")
+        # A worker that ran for a while gets a fresh backoff
+        if time.monotonic() - started > SUPERVISOR_MAX_BACKOFF:
+            delay = 1
+        log.info(f"🔁 Restarting {name} in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SUPERVISOR_MAX_BACKOFF)
 
 # ==================== MAIN ====================
 async def main():
-    print("🚀 Starting bot...")
-    print(f"⚙️  Upload delay: {UPLOAD_DELAY}s")
-    print(f"⚙️  Max retries: {MAX_RETRIES}")
-    print(f"🔥 PURE DOWNLOAD-UPLOAD")
-    print(f"❌ NO forwarding code")
-    print(f"❌ NO captions")
-    print(f"✅ Video format preserved")
+    log.info("🚀 Starting bot...")
+    log.info(f"⚙️  Upload delay: {UPLOAD_DELAY}s (burst {UPLOAD_BURST})")
+    log.info(f"⚙️  Max retries: {MAX_RETRIES}")
+    log.info(f"⚙️  Prefetch depth: {PREFETCH_DEPTH}")
+    log.info(f"⚙️  Monitor workers: {MONITOR_WORKERS}")
+    log.info(f"♻️  Unprotected media re-sent by reference, protected media re-uploaded")
+    log.info(f"❌ NO forward header")
+    log.info(f"❌ NO captions")
+    log.info(f"✅ Video format preserved")
     
+    purge_orphan_temp_files()
     await start_health_server()
+    await init_monitoring_db()
     await start_userbot()
     await restore_monitoring()
     
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Bounded connect/pool waits so a burst of status edits fails fast instead of hanging
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .connection_pool_size(BOT_POOL_SIZE)
+        .connect_timeout(10)
+        .pool_timeout(10)
+        .build()
+    )
     
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("channels", channels_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
     
-    print("✅ Bot ready!")
+    log.info("✅ Bot ready!")
     
     await app.initialize()
     await app.start()
     await app.updater.start_polling()
     
     try:
-        while True:
-            await asyncio.sleep(1)
-    except (KeyboardInterrupt, SystemExit):
-        print("\n⚠️  Shutting down...")
+        # Background workers run until shutdown cancels the group
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(supervise("DB persister", _persister))
+            tg.create_task(supervise("Unjoined poller", poll_unjoined))
+            for i in range(MONITOR_WORKERS):
+                tg.create_task(supervise(f"Monitor worker {i + 1}", monitor_worker))
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        log.info("⚠️  Shutting down...")
         await app.updater.stop()
         await app.stop()
         await app.shutdown()
-        await userbot.disconnect()
-        print("✅ Bot stopped")
+        await stop_userbot()
+        await save_monitoring_db()
+        await close_monitoring_db()
+        log.info("✅ Bot stopped")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+        uvloop.install()
+        log.info("✅ uvloop: libuv event loop enabled")
+    except ImportError:
+        pass
+    try:
+        asyncio.run(main())
+    finally:
+        _log_listener.stop()